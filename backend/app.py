@@ -1,13 +1,35 @@
+import hashlib
+import logging
+import threading
+
+from cachetools import TTLCache
+import orjson
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import pandas as pd
-import numpy as np
-from utils import compute_weekly_summary, _parse_date_col, _find_weight_col, _find_calories_col
-from utils import compute_energy_from_macros
+from utils import compute_weekly_summary, _parse_date_col, _classify_columns
+from utils import compute_energy_from_macros, read_csv_upload, _numeric
 
 app = Flask(__name__)
 CORS(app)
 
+# serialized successful /analyze responses keyed by upload contents + request options
+_response_cache = TTLCache(maxsize=64, ttl=600)
+# cachetools caches are not thread-safe and requests are served on several threads
+_response_cache_lock = threading.Lock()
+
+
+def _hash_uploads(files):
+    """Return a sha256 hex digest of the uploaded files' contents."""
+    h = hashlib.sha256()
+    for f in files:
+        data = f.read()
+        f.stream.seek(0)
+        # length prefix keeps file boundaries part of the digest
+        h.update(len(data).to_bytes(8, 'little'))
+        h.update(data)
+    return h.hexdigest()
+
 @app.route('/health')
 def health():
     return jsonify({'status':'ok'})
@@ -18,41 +40,61 @@ def analyze():
     files = request.files.getlist('file')
     if not files:
         return jsonify({'error': 'file(s) missing'}), 400
-    print(f"Received {len(files)} files for analysis")
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug("Received %d files for analysis", len(files))
+    unit_override = request.form.get('unit')
+    start_str = request.form.get('start')
+    end_str = request.form.get('end')
+
+    # identical uploads with identical options get the cached response
+    cache_key = (_hash_uploads(files), unit_override, start_str, end_str)
+    with _response_cache_lock:
+        cached = _response_cache.get(cache_key)
+    if cached is not None:
+        return app.response_class(cached, mimetype='application/json')
+
     frames = []
     parse_errors = []
     notes = []
-    energy_reasons = []
-    unit_override = request.form.get('unit')
+    energy_reasons = set()
     for f in files:
         try:
-            df_i = pd.read_csv(f, low_memory=False)
+            df_i = read_csv_upload(f)
         except Exception as e:
             parse_errors.append(str(e))
             continue
+        if df_i is None:
+            # no date column in the header, so the rows were never parsed
+            parse_errors.append(f'no date column in file {getattr(f, "filename", "<uploaded>")}')
+            continue
+
+        # classify the columns once; the lookups below reuse it
+        roles = _classify_columns(df_i)
 
         # try to parse a date column
         try:
-            date_series = _parse_date_col(df_i)
+            date_series = _parse_date_col(df_i, roles)
         except Exception:
             # skip files without a date column
             continue
 
-        df_i['__date'] = pd.to_datetime(date_series, errors='coerce').dt.tz_localize(None)
-        df_i = df_i.dropna(subset=['__date'])
+        # keep only rows with a parseable date; df_i itself is left untouched
+        # (_parse_date_col already returns tz-naive datetime64)
+        dates = date_series.to_numpy()
+        mask = ~pd.isna(dates)
 
         # detect weight column and keep date + weight
-        wcol = _find_weight_col(df_i)
+        wcol = roles['weight'][0] if roles['weight'] else None
 
-        out_df = df_i[['__date']].copy()
+        out_df = pd.DataFrame({'__date': dates[mask]})
         if wcol is not None:
-            out_df['Weight'] = pd.to_numeric(df_i[wcol], errors='coerce')
+            out_df['Weight'] = _numeric(df_i[wcol])[mask]
 
         # Primary calories source: compute from macros or explicit energy column
-        energy_series, reason = compute_energy_from_macros(df_i)
+        energy_series, reason = compute_energy_from_macros(df_i, roles)
         if energy_series is not None:
-            out_df['Energy'] = energy_series
-            energy_reasons.append(reason)
+            out_df['Energy'] = energy_series.to_numpy()[mask]
+            energy_reasons.add(reason)
             notes.append(f'Computed Energy ({reason}) from file {getattr(f, "filename", "<uploaded>")}')
 
         # collect this file's output even if it only has weight or only has energy
@@ -61,12 +103,13 @@ def analyze():
     if not frames:
         return jsonify({'error': 'no valid data parsed', 'detail': parse_errors}), 400
 
-    # concatenate all frames by date
-    merged = pd.concat(frames, axis=0, ignore_index=True)
+    # concatenate all frames by date (a single upload is used as-is)
+    if len(frames) == 1:
+        merged = frames[0]
+    else:
+        merged = pd.concat(frames, axis=0, ignore_index=True)
 
     # optional server-side date filtering: accept ISO date strings in form fields 'start' and 'end'
-    start_str = request.form.get('start')
-    end_str = request.form.get('end')
     start_dt = None
     end_dt = None
     try:
@@ -78,9 +121,6 @@ def analyze():
         start_dt = None
         end_dt = None
     if start_dt is not None or end_dt is not None:
-        # ensure merged has __date column
-        if '__date' not in merged.columns:
-            merged['__date'] = pd.to_datetime(_parse_date_col(merged), errors='coerce').dt.tz_localize(None)
         if start_dt is not None:
             merged = merged[merged['__date'] >= start_dt]
         if end_dt is not None:
@@ -88,28 +128,13 @@ def analyze():
         if merged.empty:
             return jsonify({'error': 'no data in requested date range', 'detail': f'start={start_str} end={end_str}'}), 400
 
-    # Coalesce possible duplicated weight/energy columns created by merging
     try:
-        # find any columns containing 'weight' or 'energy' and coalesce them
-        weight_cols = [c for c in merged.columns if 'weight' in c.lower()]
-        energy_cols = [c for c in merged.columns if 'energy' in c.lower()]
-
-        def coalesce_numeric(df, cols):
-            if not cols:
-                return None
-            # convert to numeric and pick first non-null per-row
-            nums = df[cols].apply(pd.to_numeric, errors='coerce')
-            return nums.apply(lambda row: next((v for v in row if pd.notna(v)), np.nan), axis=1)
-
-        if weight_cols:
-            merged['Weight'] = coalesce_numeric(merged, weight_cols)
-        if energy_cols:
-            merged['Energy'] = coalesce_numeric(merged, energy_cols)
-
-        # drop any older weight/energy columns except the canonical ones
-        drop_cols = [c for c in merged.columns if (('weight' in c.lower() or 'energy' in c.lower() or 'kcal' in c.lower() or 'calorie' in c.lower()) and c not in ('Weight', 'Energy'))]
-        if drop_cols:
-            merged = merged.drop(columns=drop_cols)
+        # collapse rows from different files into one row per calendar day
+        # (timestamped uploads would otherwise keep one row per timestamp)
+        value_cols = [c for c in ('Weight', 'Energy') if c in merged.columns]
+        if len(frames) > 1 and value_cols:
+            merged = merged.assign(__date=merged['__date'].dt.normalize())
+            merged = merged.groupby('__date', as_index=False).agg(dict.fromkeys(value_cols, 'mean'))
 
         summary = compute_weekly_summary(merged, unit_override=unit_override)
 
@@ -127,12 +152,16 @@ def analyze():
                 'unit_override': summary.get('meta', {}).get('unit_override'),
                 'initial_days': summary.get('meta', {}).get('initial_days'),
                 'filtered_days': summary.get('meta', {}).get('filtered_days'),
-                'energy_reasons': list(set(energy_reasons)),
+                'energy_reasons': list(energy_reasons),
                 'start': start_str or None,
                 'end': end_str or None
             }
         }
-        return jsonify(lean)
+        # orjson serializes floats (and any numpy scalars) natively, much faster than jsonify
+        body = orjson.dumps(lean, option=orjson.OPT_SERIALIZE_NUMPY)
+        with _response_cache_lock:
+            _response_cache[cache_key] = body
+        return app.response_class(body, mimetype='application/json')
     except ValueError as ve:
         # expected user/data error (e.g., no valid days after filtering)
         return jsonify({'error': 'bad input', 'detail': str(ve), 'notes': notes, 'parse_errors': parse_errors}), 400
@@ -0,0 +1,38 @@
+"""Tests for combining several uploads in /analyze."""
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import app
+
+
+def _csv(df):
+    return io.BytesIO(df.to_csv(index=False).encode())
+
+
+def test_all_nan_day_stays_nan_after_collapse():
+    dates = pd.date_range('2024-01-01', periods=21, freq='D')
+    weight = pd.Series(180 - np.arange(21) * 0.1)
+    energy = pd.Series(2000 + (np.arange(21) % 7) * 50.0)
+    # 2024-01-03 has neither weight nor energy in either file
+    weight[2] = np.nan
+    energy[2] = np.nan
+    weight_file = pd.DataFrame({'Date': dates.strftime('%Y-%m-%d'), 'Weight': weight})
+    # timestamped rows land on the same calendar days as the date-only ones
+    energy_file = pd.DataFrame({'Date': (dates + pd.Timedelta('19:15:00')).strftime('%Y-%m-%d %H:%M'), 'Energy': energy})
+
+    r = app.test_client().post('/analyze', data={
+        'file': [(_csv(weight_file), 'weight.csv'), (_csv(energy_file), 'energy.csv')],
+    }, content_type='multipart/form-data')
+    body = r.get_json()
+
+    assert r.status_code == 200
+    assert body['meta']['initial_days'] == 21
+    assert body['meta']['filtered_days'] == 1
+    first = body['rows'][0]
+    assert first['week'] == '2024-W01'
+    assert first['samples'] == 6
+    assert first['avg_weight'] == pytest.approx(1078.1 / 6)
+    assert first['avg_calories'] == pytest.approx(12950 / 6)
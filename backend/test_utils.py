@@ -0,0 +1,79 @@
+"""Regression tests for the upload reader and the weekly summary.
+
+Expected values are the output of the original (pre-vectorization) pandas
+implementation on the same inputs. Run with `python -m pytest` from backend/.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import compute_weekly_summary, read_csv_upload
+
+
+def _upload(dates, energy=None):
+    """Return an in-memory CSV upload with Date, Weight and Energy columns."""
+    n = len(dates)
+    if energy is None:
+        energy = 2000 + (np.arange(n) % 7) * 50.0
+    df = pd.DataFrame({'Date': dates, 'Weight': 180 - np.arange(n) * 0.1, 'Energy': energy})
+    return io.BytesIO(df.to_csv(index=False).encode())
+
+
+def _weeks(summary):
+    return [(r['week'], r['samples'], r['avg_weight'], r['avg_calories']) for r in summary['rows']]
+
+
+def test_year_boundary_week():
+    # 2020 has an ISO week 53 that runs from Mon 2020-12-28 to Sun 2021-01-03
+    dates = pd.date_range('2020-12-21', periods=28, freq='D').strftime('%Y-%m-%d')
+    summary = compute_weekly_summary(read_csv_upload(_upload(dates)))
+    assert _weeks(summary) == [
+        ('2020-W52', 7, pytest.approx(179.7), 2150.0),
+        ('2020-W53', 7, pytest.approx(179.0), 2150.0),
+        ('2021-W01', 7, pytest.approx(178.3), 2150.0),
+        ('2021-W02', 7, pytest.approx(177.6), 2150.0),
+    ]
+    assert summary['slope_raw_per_week'] == pytest.approx(-0.7)
+    assert summary['estimated_maintenance'] == pytest.approx(2500.0)
+    assert summary['meta']['initial_days'] == 28
+
+
+def test_offset_timestamps_keep_wall_time():
+    # 22:30 at -05:00 is the next day in UTC; the Sunday entry must stay in W01
+    dates = pd.date_range('2024-01-01 22:30', periods=21, freq='D').strftime('%Y-%m-%dT%H:%M:%S-0500')
+    df = read_csv_upload(_upload(dates))
+    assert df['Date'].iloc[0] == '2024-01-01T22:30:00-0500'
+    summary = compute_weekly_summary(df)
+    assert _weeks(summary) == [
+        ('2024-W01', 7, pytest.approx(179.7), 2150.0),
+        ('2024-W02', 7, pytest.approx(179.0), 2150.0),
+        ('2024-W03', 7, pytest.approx(178.3), 2150.0),
+    ]
+
+
+def test_non_iso_date_column():
+    dates = pd.date_range('2024-01-01', periods=21, freq='D').strftime('%m/%d/%Y')
+    summary = compute_weekly_summary(read_csv_upload(_upload(dates)))
+    assert [w[:2] for w in _weeks(summary)] == [('2024-W01', 7), ('2024-W02', 7), ('2024-W03', 7)]
+    assert summary['estimated_maintenance'] == pytest.approx(2500.0)
+
+
+def test_non_numeric_energy_cell():
+    energy = (2000 + (np.arange(21) % 7) * 50.0).astype(object)
+    energy[6] = 'abc'
+    df = read_csv_upload(_upload(pd.date_range('2024-01-01', periods=21, freq='D').strftime('%Y-%m-%d'), energy))
+    summary = compute_weekly_summary(df)
+    # the bad cell is dropped from the average, but its weight still counts
+    assert _weeks(summary) == [
+        ('2024-W01', 7, pytest.approx(179.7), 2125.0),
+        ('2024-W02', 7, pytest.approx(179.0), 2150.0),
+        ('2024-W03', 7, pytest.approx(178.3), 2150.0),
+    ]
+    assert summary['estimated_maintenance'] == pytest.approx(2491.6666667)
+    assert summary['meta']['filtered_days'] == 0
+
+
+def test_read_csv_upload_without_date_column():
+    assert read_csv_upload(io.BytesIO(b'a,b\n1,2\n')) is None
@@ -1,56 +1,197 @@
+import io
+import re
+
 import pandas as pd
 import numpy as np
 
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:  # optional: read_csv_upload falls back to the C engine
+    pa = None
+
 KCAL_PER_LB = 3500.0
 KCAL_PER_KG = KCAL_PER_LB / 0.45359237  # ~7700
 
+# Keywords of the columns the analysis reads (date, weight, energy and macros);
+# everything else in a Cronometer export is skipped when parsing.
+CSV_COLUMN_KEYWORDS = ('date', 'weight', 'energy', 'kcal', 'calorie', 'alcohol', 'fat', 'carb', 'protein')
+CSV_CHUNKSIZE = 50_000
+
+# date shapes recognised by _sniff_date_format: '2024-01-31' and '2024-01-31T08:00...'
+_ISO_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+_ISO_DATETIME_RE = re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}')
+
+# (name substring, role) for macro columns, checked in order; the first match wins
+MACRO_KEYS = (('alcohol', 'alcohol'), ('fat', 'fat'), ('carb', 'carbs'), ('protein', 'protein'))
+
+
+def _relevant_columns(columns):
+    """Return the columns whose name matches one of CSV_COLUMN_KEYWORDS."""
+    relevant = []
+    for c in columns:
+        # lowercase each name once, not once per keyword
+        low = str(c).lower()
+        if any(k in low for k in CSV_COLUMN_KEYWORDS):
+            relevant.append(c)
+    return relevant
+
+
+def read_csv_upload(f):
+    """Read an uploaded CSV into a DataFrame holding only the relevant columns.
+
+    The header is read first so that only the relevant columns are tokenized and
+    the weight/energy/macro columns are parsed straight to float64. Date columns
+    are kept as raw strings so that `_to_datetime` parses them (pyarrow's own
+    timestamp inference would convert offset times to UTC).
+    Uses the multithreaded pyarrow parser when available and falls back to the
+    default C engine, read in chunks of CSV_CHUNKSIZE rows, which leaves
+    non-numeric values to be coerced by the callers.
+    Returns None, without parsing any rows, when the file has no date column.
+    """
+    data = f.read()
+    header = pd.read_csv(io.BytesIO(data), nrows=0)
+    usecols = _relevant_columns(header.columns)
+    roles = _classify_columns(header[usecols])
+    if not roles['date']:
+        return None
+    numeric_cols = roles['weight'] + roles['energy'] + roles['alcohol'] + roles['fat'] + roles['carbs'] + roles['protein']
+    if pa is not None:
+        try:
+            convert_options = pa_csv.ConvertOptions(
+                include_columns=usecols,
+                column_types={**dict.fromkeys(numeric_cols, pa.float64()), **dict.fromkeys(roles['date'], pa.string())},
+                strings_can_be_null=True
+            )
+            return pa_csv.read_csv(io.BytesIO(data), convert_options=convert_options).to_pandas()
+        except Exception:
+            pass
+    chunks = pd.read_csv(io.BytesIO(data), usecols=usecols, chunksize=CSV_CHUNKSIZE, low_memory=False)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _classify_columns(df):
+    """Classify every column by its role in a single pass over the column names.
+
+    Returns a dict mapping 'date', 'weight', 'energy', 'alcohol', 'fat', 'carbs'
+    and 'protein' to the list of matching columns, in column order.
+    """
+    roles = {'date': [], 'weight': [], 'energy': [], 'alcohol': [], 'fat': [], 'carbs': [], 'protein': []}
+    for col in df.columns:
+        low = col.strip().lower()
+        if 'date' in low:
+            roles['date'].append(col)
+        elif col == 'Weight':
+            roles['weight'].append(col)
+        elif low in ('energy', 'calories', 'energy (kcal)', 'calories (kcal)'):
+            roles['energy'].append(col)
+        else:
+            for needle, key in MACRO_KEYS:
+                if needle in low:
+                    roles[key].append(col)
+                    break
+    return roles
+
+
+def _numeric(s):
+    """Return a Series as a float64 array, coercing non-numeric values to NaN.
 
-def compute_energy_from_macros(df):
+    Numeric columns (the usual case after read_csv_upload) skip pd.to_numeric
+    and are returned without a copy when they are already float64.
+    """
+    if pd.api.types.is_numeric_dtype(s.dtype):
+        return s.to_numpy(dtype=float, copy=False)
+    return pd.to_numeric(s, errors='coerce').to_numpy(dtype=float)
+
+
+def compute_energy_from_macros(df, roles=None):
     """Return (Series energy, reason).
 
     First tries to find explicit Energy/Calories column.
     If not found, assumes macro columns in the CSV are already reported in kcal (not grams).
     Sum any available macro columns (Alcohol, Fat, Carbs, Protein) and return the
     per-row energy Series and a reason string.
+    `roles` is the result of `_classify_columns(df)` when the caller already has it.
     """
+    if roles is None:
+        roles = _classify_columns(df)
+
     # First check for explicit Energy or Calories column
-    for col in df.columns:
-        low = col.strip().lower()
-        if low in ('energy', 'calories', 'energy (kcal)', 'calories (kcal)'):
-            return pd.to_numeric(df[col], errors='coerce'), 'explicit_energy_column'
-    
+    if roles['energy']:
+        return pd.to_numeric(df[roles['energy'][0]], errors='coerce'), 'explicit_energy_column'
+
     # If no explicit energy column, try to compute from macros
-    found = {}
-    for col in df.columns:
-        low = col.strip().lower()
-        if 'alcohol' in low:
-            found.setdefault('alcohol', []).append(col)
-        elif 'fat' in low:
-            found.setdefault('fat', []).append(col)
-        elif 'carb' in low:
-            found.setdefault('carbs', []).append(col)
-        elif 'protein' in low:
-            found.setdefault('protein', []).append(col)
-
-    if not found:
+    cols = roles['alcohol'] + roles['fat'] + roles['carbs'] + roles['protein']
+    if not cols:
         return None, 'no_macros'
 
-    macros = {}
-    for key, cols in found.items():
-        macros[key] = df[cols].apply(pd.to_numeric, errors='coerce').sum(axis=1)
-
-    # Sum available macro columns (assumed kcal)
-    energy = sum(macros.values())
+    # Stack every macro column into one (rows, cols) block and sum it in a single
+    # pass (assumed kcal); missing values count as 0 like Series.sum does.
+    # Already-numeric columns (the usual case) convert as one block.
+    block = df[cols]
+    if all(pd.api.types.is_numeric_dtype(t) for t in block.dtypes):
+        macros = block.to_numpy(dtype=float)
+    else:
+        macros = np.column_stack([_numeric(block[c]) for c in cols])
+    energy = pd.Series(np.nansum(macros, axis=1), index=df.index)
     return energy, 'macros_as_kcal'
 
 
-def _parse_date_col(df):
-    for col in df.columns:
-        if 'date' in col.lower():
-            return pd.to_datetime(df[col], errors='coerce')
+def _sniff_date_format(values):
+    """Guess a to_datetime format from the first non-null value, or None."""
+    first = values.first_valid_index()
+    if first is None:
+        return None
+    sample = values.loc[first]
+    if not isinstance(sample, str):
+        return None
+    sample = sample.strip()
+    if _ISO_DATE_RE.fullmatch(sample):
+        return '%Y-%m-%d'
+    if _ISO_DATETIME_RE.match(sample):
+        return 'ISO8601'
+    return None
+
+
+def _to_datetime(values):
+    """Parse dates using a format sniffed from the first non-null value.
+
+    Falls back to per-value format inference when no format is recognised or it
+    does not fit every value. Values that already have a datetime64 dtype are
+    returned without re-parsing.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    fmt = _sniff_date_format(values)
+    if fmt is not None:
+        try:
+            return pd.to_datetime(values, format=fmt, cache=True)
+        except (ValueError, TypeError):
+            pass
+    return pd.to_datetime(values, errors='coerce', cache=True)
+
+
+def _strip_tz(dates):
+    """Drop the timezone of tz-aware dates, keeping the wall time in that timezone.
+
+    For dates parsed from offset strings this is the time as written; dates that
+    were already converted to UTC keep their UTC wall time.
+    """
+    if isinstance(dates.dtype, pd.DatetimeTZDtype):
+        return dates.dt.tz_localize(None) if isinstance(dates, pd.Series) else dates.tz_localize(None)
+    return dates
+
+
+def _parse_date_col(df, roles=None):
+    # the canonical '__date' column built by analyze needs no column scan
+    if '__date' in df.columns:
+        return _strip_tz(_to_datetime(df['__date']))
+    date_cols = (roles if roles is not None else _classify_columns(df))['date']
+    if date_cols:
+        return _strip_tz(_to_datetime(df[date_cols[0]]))
     # fallback to index if datetime
     if 'datetime64' in str(df.index.dtype):
-        return pd.to_datetime(df.index)
+        return _strip_tz(pd.to_datetime(df.index))
     raise ValueError('No date column found')
 
 
@@ -62,11 +203,49 @@ def _find_calories_col(df):
     return 'Energy' if 'Energy' in df.columns else None
 
 
+def _weekly_aggregates(date, weight, energy):
+    """Aggregate daily values into Monday-based weeks.
+
+    Takes flat datetime64 / float64 arrays and returns the arrays
+    (week, samples, avg_weight, avg_calories) for every week with at least one
+    day, where `week` counts weeks from the Monday before 1970-01-01 (a Thursday).
+    NaN values are ignored in the means; a week without any valid value averages to NaN.
+    """
+    day = date.astype('datetime64[D]').astype(np.int64)
+    week = (day + 3) // 7
+    week_min = week.min()
+    week_id = week - week_min
+    w_valid = ~np.isnan(weight)
+    e_valid = ~np.isnan(energy)
+    samples = np.bincount(week_id)
+    n_weeks = len(samples)
+    with np.errstate(invalid='ignore'):
+        avg_weight = np.bincount(week_id[w_valid], weights=weight[w_valid], minlength=n_weeks) / np.bincount(week_id[w_valid], minlength=n_weeks)
+        avg_calories = np.bincount(week_id[e_valid], weights=energy[e_valid], minlength=n_weeks) / np.bincount(week_id[e_valid], minlength=n_weeks)
+    present = np.flatnonzero(samples)
+    return week_min + present, samples[present], avg_weight[present], avg_calories[present]
+
+
+def _fit_line(x, y):
+    """Return (slope, intercept) of the least-squares line through x, y.
+
+    Both are None when there are fewer than two points or x has no spread.
+    """
+    if len(x) < 2:
+        return None, None
+    # closed-form simple linear regression: m = cov(x, y) / var(x)
+    xm = x.mean()
+    ym = y.mean()
+    dx = x - xm
+    sxx = dx @ dx
+    if sxx == 0:
+        return None, None
+    m = (dx @ (y - ym)) / sxx
+    return float(m), float(ym - m * xm)
+
+
 def compute_weekly_summary(df, unit_override=None):
-    df = df.copy()
-    df['__date'] = _parse_date_col(df)
-    df = df.dropna(subset=['__date'])
-    df['__date'] = pd.to_datetime(df['__date']).dt.tz_localize(None)
+    dates = _parse_date_col(df)
 
     weight_col = _find_weight_col(df)
     kcal_col = _find_calories_col(df)
@@ -74,12 +253,15 @@ def compute_weekly_summary(df, unit_override=None):
     if weight_col is None or kcal_col is None:
         raise ValueError('No weight or calorie column detected')
 
-    df['__weight'] = pd.to_numeric(df[weight_col], errors='coerce')
-
-    df['__energy'] = pd.to_numeric(df[kcal_col], errors='coerce')
+    # pull the three columns used below out as plain arrays; rows without a date are dropped
+    date = pd.DatetimeIndex(dates).to_numpy()
+    w = _numeric(df[weight_col])
+    e = _numeric(df[kcal_col])
+    has_date = ~np.isnat(date)
+    date, w, e = date[has_date], w[has_date], e[has_date]
 
     # counts before filtering
-    initial_days = len(df)
+    initial_days = len(date)
 
     # For simplicity per user request: assume all incoming weights are in pounds (lbs).
     reported_unit = 'lb'
@@ -87,27 +269,26 @@ def compute_weekly_summary(df, unit_override=None):
     # Filter incomplete days:
     # - If calorie data exists (in `Energy`), drop days with calories < 1000 (incomplete logging)
     # - Drop days that have neither weight nor energy
-    if df['__energy'].notna().any():
-        df = df[~(df['__energy'] < 1000)]
+    keep = ~(e < 1000) & ~(np.isnan(w) & np.isnan(e))
+    date, w, e = date[keep], w[keep], e[keep]
 
-    df = df[~(df['__weight'].isna() & df['__energy'].isna())]
+    filtered_days = initial_days - len(date)
 
-    filtered_days = initial_days - len(df)
-
-    if df.empty:
+    if len(date) == 0:
         raise ValueError('No valid days remaining after filtering incomplete days')
 
-    # build ISO week key
-    df['year'] = df['__date'].dt.isocalendar().year
-    df['week'] = df['__date'].dt.isocalendar().week
-    df['week_key'] = df['year'].astype(str) + '-W' + df['week'].astype(str).str.zfill(2)
-
-    # For each week compute averages and counts of valid days
-    grouped = df.groupby('week_key').agg(
-        avg_weight=('__weight', 'mean'),
-        avg_calories=('__energy', 'mean'),
-        samples=('__date', 'count')
-    ).reset_index().sort_values('week_key')
+    # aggregate into weeks; label each by the ISO year/week of its Thursday, which
+    # lies in the ISO year the week belongs to (its week number is day-of-year // 7 + 1)
+    weeks, samples, avg_weight, avg_calories = _weekly_aggregates(date, w, e)
+    thursdays = (weeks * 7).astype('datetime64[D]')
+    years = thursdays.astype('datetime64[Y]')
+    iso_week = (thursdays - years).astype(np.int64) // 7 + 1
+    grouped = pd.DataFrame({
+        '__wk': (years.astype(np.int64) + 1970) * 100 + iso_week,
+        'avg_weight': avg_weight,
+        'avg_calories': avg_calories,
+        'samples': samples
+    })
 
     # week index for regression (after filtering complete weeks)
     grouped['week_index'] = np.arange(len(grouped))
@@ -115,35 +296,25 @@ def compute_weekly_summary(df, unit_override=None):
     # decide detected unit: force pounds (lbs) per user's instruction
     detected_unit = 'lb'
 
-    def to_kg_val(w):
-        if pd.isna(w):
-            return None
-        return float(w) * 0.45359237 if detected_unit == 'lb' else float(w)
+    # weights are always pounds, so the kg conversions below use the lb factor directly
+    grouped['avg_weight_kg'] = grouped['avg_weight'].to_numpy(dtype=float) * 0.45359237
 
-    grouped['avg_weight_kg'] = grouped['avg_weight'].apply(to_kg_val)
+    # NaN masks of the weekly averages, computed once and reused below
+    has_weight = ~np.isnan(avg_weight)
+    has_calories = ~np.isnan(avg_calories)
 
     # regression on raw average weight (no conversion)
-    valid_raw = grouped.dropna(subset=['avg_weight'])
-    slope_raw_per_week = None
-    intercept_raw = None
-    if len(valid_raw) >= 2:
-        x = valid_raw['week_index'].to_numpy()
-        y = valid_raw['avg_weight'].to_numpy()
-        A = np.vstack([x, np.ones_like(x)]).T
-        m, c = np.linalg.lstsq(A, y, rcond=None)[0]
-        slope_raw_per_week = float(m)
-        intercept_raw = float(c)
+    slope_raw_per_week, intercept_raw = _fit_line(
+        grouped['week_index'].to_numpy(dtype=float)[has_weight],
+        avg_weight[has_weight]
+    )
 
     # convert raw slope to kg/week for kcal calculations
     slope_kg_per_week = None
     intercept_kg = None
     if slope_raw_per_week is not None:
-        if detected_unit == 'lb':
-            slope_kg_per_week = slope_raw_per_week * 0.45359237
-            intercept_kg = intercept_raw * 0.45359237
-        else:
-            slope_kg_per_week = slope_raw_per_week
-            intercept_kg = intercept_raw
+        slope_kg_per_week = slope_raw_per_week * 0.45359237
+        intercept_kg = intercept_raw * 0.45359237
 
     # Compute estimated daily energy change from slope (kcal/day).
     # NOTE: `slope_kg_per_week` > 0 means weight is increasing (a daily surplus).
@@ -162,40 +333,36 @@ def compute_weekly_summary(df, unit_override=None):
         est_daily_difference = daily_kcal_change
 
     overall_avg_calories = None
-    if not grouped['avg_calories'].dropna().empty:
-        overall_avg_calories = float(grouped['avg_calories'].dropna().mean())
+    if has_calories.any():
+        overall_avg_calories = float(avg_calories[has_calories].mean())
 
     estimated_maintenance = None
     if overall_avg_calories is not None and daily_kcal_change is not None:
         # maintenance = current intake - measured daily surplus
         estimated_maintenance = overall_avg_calories - daily_kcal_change
 
-    # predictions for next 4 weeks in raw units (same unit as input)
-    predictions_raw = []
+    # predictions for next 4 weeks in raw units (same unit as input) and in kg (for reference),
+    # as one affine op over the week indices; lists are only built for the result
     if slope_raw_per_week is not None and intercept_raw is not None:
-        for i in range(len(grouped)):
-            pred = intercept_raw + slope_raw_per_week * (i + 4)
-            predictions_raw.append(pred)
+        predictions = intercept_raw + slope_raw_per_week * (np.arange(len(grouped), dtype=np.float64) + 4.0)
+        predictions_raw = predictions.tolist()
+        predictions_kg = (predictions * 0.45359237).tolist()
     else:
         predictions_raw = [None] * len(grouped)
-
-    # predictions in kg (for reference)
-    predictions_kg = [p * 0.45359237 if p is not None else None for p in predictions_raw]
-
-    rows = []
-    for _, r in grouped.iterrows():
-        aw = None if pd.isna(r['avg_weight']) else float(r['avg_weight'])
-        ac = None if pd.isna(r['avg_calories']) else float(r['avg_calories'])
-        # Only include weeks that have both weight and calories present and calories >= 1000
-        if aw is None or ac is None or ac < 1000:
-            continue
-        rows.append({
-            'week': r['week_key'],
-            'avg_weight': aw,
-            'avg_weight_unit': aw,
-            'avg_calories': ac,
-            'samples': int(r['samples'])
-        })
+        predictions_kg = [None] * len(grouped)
+
+    # Only include weeks that have both weight and calories present and calories >= 1000
+    out = has_weight & (avg_calories >= 1000)
+    rows = [
+        # format the 'YYYY-Www' label only for the weeks that are returned
+        {'week': f'{k // 100}-W{k % 100:02d}', 'avg_weight': a, 'avg_weight_unit': a, 'avg_calories': c, 'samples': n}
+        for k, a, c, n in zip(
+            grouped['__wk'].to_numpy()[out].tolist(),
+            avg_weight[out].tolist(),
+            avg_calories[out].tolist(),
+            grouped['samples'].to_numpy()[out].tolist()
+        )
+    ]
 
     result = {
         'rows': rows,